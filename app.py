@@ -1,38 +1,236 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, time
+from datetime import datetime, time, timezone
+from zoneinfo import ZoneInfo
 import pytz
 import random
-import matplotlib.pyplot as plt
-import seaborn as sns
-import altair as alt
-from wordcloud import WordCloud
+import csv
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
 import io
+import os
 import base64
 
+DATA_CSV = 'dataset.csv'
+DATA_PARQUET = 'dataset.parquet'
+# Columns loaded as categories
+CATEGORY_COLUMNS = ['track', 'artist', 'album', 'platform_clean', 'type', 'reason_start', 'reason_end', 'month_year']
+
 # Load the dataset
-@st.cache_data
+@st.cache_data(ttl=None, show_spinner=False)
 def load_data():
-    df = pd.read_csv('dataset.csv')
-    # Parse timestamps
-    df['start_time'] = pd.to_datetime(df['start_time'])
-    df['end_time'] = pd.to_datetime(df['end_time'])
-    df['date'] = pd.to_datetime(df['date']).dt.date
+    # Reuse the Parquet copy unless the CSV or this script is newer
+    if os.path.exists(DATA_PARQUET) and os.path.getmtime(DATA_PARQUET) >= max(
+        os.path.getmtime(DATA_CSV), os.path.getmtime(__file__)
+    ):
+        try:
+            return pd.read_parquet(DATA_PARQUET, engine='pyarrow')
+        except (OSError, ValueError):
+            pass  # Unreadable cache: rebuild it from the CSV
+    # Parse the CSV with Arrow
+    column_types = {
+        # Raw export fields, kept as text
+        'ts': pa.string(),
+        'offline_timestamp': pa.string(),
+        'end_time': pa.timestamp('ns', 'UTC'),
+        # Narrow numeric types
+        'ms_played': pa.int32(),
+        'hours_played': pa.float32(),
+    }
+    column_types.update({col: pa.dictionary(pa.int32(), pa.string()) for col in CATEGORY_COLUMNS})
+    with open(DATA_CSV, newline='', encoding='utf-8') as f:
+        columns = next(csv.reader(f))
+    # start_time and date are derived below
+    table = pv.read_csv(
+        DATA_CSV,
+        read_options=pv.ReadOptions(block_size=8 << 20, use_threads=True),
+        convert_options=pv.ConvertOptions(
+            column_types=column_types,
+            strings_can_be_null=True,
+            include_columns=[col for col in columns if col not in ('start_time', 'date')],
+        ),
+    )
+    df = table.to_pandas()
+    # Store times as naive UTC; the user's timezone is applied when displaying
+    df['end_time'] = df['end_time'].dt.tz_localize(None)
+    end_ns = df['end_time'].to_numpy(dtype='datetime64[ns]').view('i8')
+    start_ns = end_ns - df['ms_played'].to_numpy(dtype='i8') * 1_000_000
+    # Floored to whole seconds, the same rule generate_csv.py writes start_time with
+    df['start_time'] = (start_ns // 1_000_000_000 * 1_000_000_000).view('datetime64[ns]')
+    # Calendar day (UTC)
+    df['date'] = end_ns.view('datetime64[ns]').astype('datetime64[D]')
+    df = df[columns]
+    df['minutes_played'] = df['hours_played'] * np.float32(60)
+    # Sort by start time for the time lookups
+    df = df.sort_values('start_time', kind='stable', ignore_index=True)
+    # Write to a temp file and swap it in, so a failed write leaves no partial cache
+    tmp_path = f'{DATA_PARQUET}.{os.getpid()}.tmp'
+    try:
+        df.to_parquet(tmp_path, engine='pyarrow', compression='zstd', index=False)
+        os.replace(tmp_path, DATA_PARQUET)
+    except OSError:
+        # Read-only deploy or full disk: keep serving from the CSV
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
     return df
 
 df = load_data()
 
-# Unique songs, artists, albums for dropdowns
-unique_songs = sorted(df['track'].dropna().unique())
-unique_artists = sorted(df['artist'].dropna().unique())
-unique_dates = sorted(df['date'].unique())
+# Play intervals as int64 nanoseconds (UTC), in the same order as df
+@st.cache_resource
+def time_index(_df):
+    start_ns = _df['start_time'].to_numpy(dtype='datetime64[ns]').view('i8')
+    end_ns = _df['end_time'].to_numpy(dtype='datetime64[ns]').view('i8')
+    # Running max of end times: tells whether any earlier-started play is still going
+    end_max = np.maximum.accumulate(end_ns)
+    return start_ns, end_ns, end_max
+
+def find_playing(target_ns):
+    """Return the position of the latest-started play covering target_ns, or None."""
+    start_ns, end_ns, end_max = time_index(df)
+    idx = np.searchsorted(start_ns, target_ns, side='right') - 1
+    if idx < 0 or end_max[idx] < target_ns:
+        return None
+    # Overlapping plays (e.g. quick skips) can end before an earlier one does
+    while end_ns[idx] < target_ns:
+        idx -= 1
+    return int(idx)
+
+def find_nearest(target_ns):
+    """Return the position of the play whose start is closest to target_ns."""
+    start_ns = time_index(df)[0]
+    idx = np.searchsorted(start_ns, target_ns)
+    # Only the neighbours on either side of the insertion point can be closest
+    if idx == len(start_ns) or (idx > 0 and target_ns - start_ns[idx - 1] <= start_ns[idx] - target_ns):
+        idx -= 1
+    return int(idx)
+
+# Row positions of every play per track / artist, for the search tab
+@st.cache_resource
+def build_indexes(_df):
+    track_index = _df.groupby('track', observed=True, sort=False).indices
+    artist_index = _df.groupby('artist', observed=True, sort=False).indices
+    return track_index, artist_index
+
+track_index, artist_index = build_indexes(df)
+
+# Row positions of every play per date, for the daily views
+@st.cache_resource
+def date_index(_df):
+    return _df.groupby('date', sort=False).indices
+
+# Unique songs, artists and dates for dropdowns
+@st.cache_data
+def get_unique_lists(_df):
+    return (
+        _df['track'].cat.categories.sort_values().tolist(),
+        _df['artist'].cat.categories.sort_values().tolist(),
+        pd.DatetimeIndex(_df['date'].unique()).sort_values().date.tolist(),
+    )
+
+unique_songs, unique_artists, unique_dates = get_unique_lists(df)
+
+# Listening hours per day with plays
+@st.cache_data
+def daily_totals(_df):
+    # Count per day offset from the first play
+    days = _df['date'].to_numpy(dtype='datetime64[D]').view('i8')
+    first_day = days.min()
+    offsets = days - first_day
+    plays = np.bincount(offsets)
+    hours = np.bincount(offsets, weights=_df['hours_played'].to_numpy(dtype='f8'))
+    played = np.flatnonzero(plays)
+    index = pd.DatetimeIndex((played + first_day).astype('datetime64[D]'), name='date')
+    return pd.DataFrame({'hours': hours[played]}, index=index)
+
+# Longest run of consecutive days with at least one play
+@st.cache_data
+def longest_streak(_df):
+    days = daily_totals(_df).index.to_numpy(dtype='datetime64[D]')
+    if len(days) == 0:
+        return 0
+    # A new run starts wherever the gap to the previous day is not exactly one day
+    breaks = np.diff(days).astype('i8') != 1
+    runs = np.cumsum(np.concatenate(([0], breaks)))
+    return int(np.bincount(runs).max())
+
+# Top 5 songs of a day
+@st.cache_data
+def daily_top_songs(_df, day):
+    day_rows = date_index(_df).get(day)
+    if day_rows is None:
+        return pd.Series(dtype='int64')
+    return _df['track'].take(day_rows).value_counts().loc[lambda counts: counts > 0].head(5)
+
+# Plays per UTC start hour of a day
+@st.cache_data
+def daily_hourly_plays(_df, day):
+    day_rows = date_index(_df).get(day)
+    start_ns = time_index(_df)[0][day_rows] if day_rows is not None else np.empty(0, dtype='i8')
+    # Hour of day from epoch nanoseconds
+    hours = (start_ns // 3_600_000_000_000) % 24
+    return pd.DataFrame({'hour': np.arange(24), 'Plays': np.bincount(hours, minlength=24)})
+
+# Plays per local day for the listening timeline
+@st.cache_data(show_spinner=False)
+def timeline_plays(_df, rows, tz):
+    local_days = _df['start_time'].take(rows).dt.tz_localize('UTC').dt.tz_convert(tz).dt.date.astype(str)
+    return local_days.value_counts(sort=False).sort_index().rename_axis('date_str').reset_index(name='Plays')
+
+# Top 10 songs of every month
+@st.cache_data
+def era_top_songs(_df):
+    counts = _df.groupby(['month_year', 'track'], observed=True, sort=False).size()
+    return {
+        month: plays.droplevel('month_year').nlargest(10)
+        for month, plays in counts.groupby(level='month_year', observed=True, sort=False)
+    }
+
+# Era export as CSV bytes
+@st.cache_data
+def era_csv_bytes(_df, month_year):
+    era = _df[_df['month_year'] == month_year].drop(columns='minutes_played')
+    # Full-precision hours for the export
+    era = era.assign(hours_played=era['ms_played'] / 3_600_000)
+    table = pa.Table.from_pandas(era, preserve_index=False)
+    # Times in whole seconds labelled as UTC, date as a day
+    schema = pa.schema([
+        field.with_type(pa.date32()) if field.name == 'date'
+        else field.with_type(pa.timestamp('s', 'UTC')) if pa.types.is_timestamp(field.type)
+        else field
+        for field in table.schema
+    ])
+    buf = io.BytesIO()
+    pv.write_csv(table.cast(schema, safe=False), buf)
+    return buf.getvalue()
+
+def new_quiz():
+    """Pick a quiz date and keep only its first track in session state."""
+    st.session_state.quiz_date = random.choice(unique_dates)
+    # Plays are in start order, so a date's first row position is its first song
+    day_rows = date_index(df).get(pd.Timestamp(st.session_state.quiz_date))
+    st.session_state.quiz_song = df['track'].iat[day_rows[0]] if day_rows is not None else "No song"
+
+# Timezone choices and the default's position
+@st.cache_resource
+def timezone_options():
+    timezones = list(pytz.all_timezones)
+    return timezones, timezones.index('Asia/Kolkata')  # Default to IN timezone
+
+@st.cache_resource
+def get_tz(name):
+    return ZoneInfo(name)
 
 # Sidebar for timezone selection
 st.sidebar.header("Settings")
+timezones, default_tz_index = timezone_options()
 user_tz = st.sidebar.selectbox(
     "Select your timezone",
-    options=pytz.all_timezones,
-    index=pytz.all_timezones.index('Asia/Kolkata')  # Default to IN timezone
+    options=timezones,
+    index=default_tz_index
 )
 
 # Fun feature: Theme selector
@@ -61,25 +259,23 @@ with tab1:
     selected_time = st.time_input("Select Time", value=time(12, 0), step=60)  # Step of 60 seconds (1 minute)
 
     if st.button("Open Time Capsule"):
-        # Combine date and time
-        local_dt = datetime.combine(selected_date, selected_time)
-        # Localize to user timezone
-        local_tz = pytz.timezone(user_tz)
-        local_dt = local_tz.localize(local_dt)
-        # Convert to UTC
-        utc_dt = local_dt.astimezone(pytz.utc)
-
-        # Find rows where start_time <= utc_dt <= end_time
-        playing = df[(df['start_time'] <= utc_dt) & (df['end_time'] >= utc_dt)]
-
-        if not playing.empty:
-            row = playing.iloc[0]  # Assume no overlaps
+        # Combine date and time in the user's timezone
+        local_dt = datetime.combine(selected_date, selected_time, tzinfo=get_tz(user_tz))
+        # UTC epoch nanoseconds, comparable with the cached play intervals
+        target_ns = pd.Timestamp(local_dt).value
+
+        # Find the play where start_time <= target <= end_time
+        idx = find_playing(target_ns)
+
+        if idx is not None:
+            row = df.iloc[idx]
+            utc_dt = local_dt.astimezone(timezone.utc)
             st.success(f"At {utc_dt} UTC ({local_dt} in {user_tz}), you were listening to:")
             st.markdown(f"**Track:** {row['track']}")
             st.markdown(f"**Artist:** {row['artist']}")
             st.markdown(f"**Album:** {row['album']}")
             st.markdown(f"**Platform:** {row['platform_clean']}")
-            st.markdown(f"**Duration Played:** {row['hours_played'] * 60:.2f} minutes")
+            st.markdown(f"**Duration Played:** {row['minutes_played']:.2f} minutes")
 
             # Fun feature: Spotify link
             if pd.notna(row['spotify_track_uri']):
@@ -107,9 +303,8 @@ with tab1:
         else:
             st.warning("No song was playing at that exact time. Maybe you were taking a break? 🎧")
             # Find nearest
-            df['time_diff'] = abs(df['start_time'] - utc_dt)
-            nearest = df.loc[df['time_diff'].idxmin()]
-            st.markdown(f"Nearest song: **{nearest['track']}** by {nearest['artist']} at {nearest['start_time']}")
+            nearest = df.iloc[find_nearest(target_ns)]
+            st.markdown(f"Nearest song: **{nearest['track']}** by {nearest['artist']} at {nearest['start_time'].tz_localize('UTC')}")
 
 with tab2:
     st.header("When did I listen to a specific song?")
@@ -118,19 +313,30 @@ with tab2:
     search_type = st.radio("Search by", ["Song", "Artist"])
     if search_type == "Song":
         selected_song = st.selectbox("Select Song", options=unique_songs)
-        filtered = df[df['track'] == selected_song]
+        rows = track_index.get(selected_song)
     else:
         selected_artist = st.selectbox("Select Artist", options=unique_artists)
-        filtered = df[df['artist'] == selected_artist]
+        rows = artist_index.get(selected_artist)
 
-    if not filtered.empty:
+    if rows is not None:
+        filtered = df.take(rows)
         st.subheader(f"Listen History for {selected_song if search_type == 'Song' else selected_artist}")
         # Convert times to user timezone
-        filtered['start_local'] = filtered['start_time'].dt.tz_convert(user_tz)
-        filtered['end_local'] = filtered['end_time'].dt.tz_convert(user_tz)
-
-        for _, row in filtered.iterrows():
-            st.markdown(f"- {row['start_local']} to {row['end_local']} ({row['hours_played'] * 60:.2f} min) on {row['platform_clean']}")
+        filtered = filtered.assign(
+            start_local=filtered['start_time'].dt.tz_localize('UTC').dt.tz_convert(user_tz),
+            end_local=filtered['end_time'].dt.tz_localize('UTC').dt.tz_convert(user_tz),
+        )
+
+        # Listen history table
+        history = filtered[['start_local', 'end_local', 'minutes_played', 'platform_clean']].rename(
+            columns={'start_local': 'Start', 'end_local': 'End', 'minutes_played': 'Minutes', 'platform_clean': 'Platform'}
+        )
+        st.dataframe(
+            history,
+            width='stretch',
+            hide_index=True,
+            column_config={'Minutes': st.column_config.NumberColumn(format="%.2f")},
+        )
 
         # Fun feature: Total plays
         total_plays = len(filtered)
@@ -143,8 +349,9 @@ with tab2:
 
         # New fun feature: Timeline chart
         if st.checkbox("Show Listening Timeline"):
-            filtered['date_str'] = filtered['start_local'].dt.date.astype(str)
-            chart_data = filtered.groupby('date_str').size().reset_index(name='Plays')
+            import altair as alt
+
+            chart_data = timeline_plays(df, rows, user_tz)
             chart = alt.Chart(chart_data).mark_line().encode(
                 x='date_str:T',
                 y='Plays:Q',
@@ -160,38 +367,47 @@ with tab3:
 
     # Date selector for daily summary
     insight_date = st.date_input("Select Date for Daily Summary", value=datetime.now().date())
-    daily_df = df[df['date'] == insight_date]
+    insight_day = pd.Timestamp(insight_date)
+    day_rows = date_index(df).get(insight_day)
 
-    if not daily_df.empty:
+    # Row positions of the selected day's plays
+    if day_rows is not None:
         st.subheader(f"Summary for {insight_date}")
-        total_hours_day = daily_df['hours_played'].sum()
+        total_hours_day = daily_totals(df).at[insight_day, 'hours']
         st.markdown(f"Total listening time: {total_hours_day:.2f} hours")
         
         # Top songs
-        top_songs = daily_df['track'].value_counts().head(5)
+        top_songs = daily_top_songs(df, insight_day)
         st.markdown("Top Songs:")
         for song, count in top_songs.items():
             st.markdown(f"- {song}: {count} plays")
         
         # Visualization: Listening over the day
         if st.checkbox("Show Daily Listening Chart"):
-            daily_df['hour'] = daily_df['start_time'].dt.hour
-            fig, ax = plt.subplots()
-            sns.countplot(x='hour', data=daily_df, ax=ax)
-            ax.set_title("Listening Activity by Hour")
-            st.pyplot(fig)
+            import altair as alt
+
+            chart_data = daily_hourly_plays(df, insight_day)
+            chart = alt.Chart(chart_data).mark_bar().encode(
+                x='hour:O',
+                y='Plays:Q',
+                tooltip=['hour', 'Plays']
+            ).properties(title="Listening Activity by Hour")
+            st.altair_chart(chart, use_container_width=True)
         
         # Fun feature: Generate a "Time Capsule Message"
         if st.button("Generate Time Capsule Message"):
-            random_song = daily_df.sample(1).iloc[0]
+            random_song = df.iloc[random.choice(day_rows)]
             message = f"On {insight_date}, you were vibing to '{random_song['track']}' by {random_song['artist']}. Remember the good times! ⏳🎶"
             st.success(message)
             st.balloons()
 
         # New fun feature: Word cloud of song titles
         if st.checkbox("Show Song Title Word Cloud"):
-            text = ' '.join(daily_df['track'].dropna())
+            text = ' '.join(df['track'].take(day_rows).dropna())
             if text:
+                import matplotlib.pyplot as plt
+                from wordcloud import WordCloud
+
                 wordcloud = WordCloud(width=800, height=400, background_color='white').generate(text)
                 fig, ax = plt.subplots()
                 ax.imshow(wordcloud, interpolation='bilinear')
@@ -208,8 +424,8 @@ with tab4:
 
     # Fun feature 1: Random Time Capsule
     if st.button("Jump to a Random Moment"):
-        random_row = df.sample(1).iloc[0]
-        local_start = random_row['start_time'].tz_convert(user_tz)
+        random_row = df.iloc[random.randrange(len(df))]
+        local_start = random_row['start_time'].tz_localize('UTC').tz_convert(user_tz)
         st.success(f"Time warp to {local_start}! You were listening to:")
         st.markdown(f"**Track:** {random_row['track']}")
         st.markdown(f"**Artist:** {random_row['artist']}")
@@ -219,9 +435,7 @@ with tab4:
     st.subheader("Music Time Machine Quiz")
     st.markdown("Test your memory! I'll give you a date, you guess the song.")
     if 'quiz_date' not in st.session_state:
-        st.session_state.quiz_date = random.choice(unique_dates)
-        quiz_df = df[df['date'] == st.session_state.quiz_date]
-        st.session_state.quiz_song = quiz_df.iloc[0]['track'] if not quiz_df.empty else "No song"
+        new_quiz()
 
     st.markdown(f"On {st.session_state.quiz_date}, what song did you listen to first?")
     user_guess = st.text_input("Your guess:")
@@ -232,24 +446,22 @@ with tab4:
         else:
             st.error(f"Nope! It was {st.session_state.quiz_song}.")
         if st.button("New Quiz"):
-            st.session_state.quiz_date = random.choice(unique_dates)
-            quiz_df = df[df['date'] == st.session_state.quiz_date]
-            st.session_state.quiz_song = quiz_df.iloc[0]['track'] if not quiz_df.empty else "No song"
+            new_quiz()
             st.rerun()
 
     # Fun feature 3: Generate Playlist from Era
     st.subheader("Era Playlist Generator")
-    selected_month_year = st.selectbox("Select Month-Year", sorted(df['month_year'].unique()))
-    era_df = df[df['month_year'] == selected_month_year]
-    if not era_df.empty:
-        top_era_songs = era_df['track'].value_counts().head(10)
+    era_songs = era_top_songs(df)
+    selected_month_year = st.selectbox("Select Month-Year", sorted(era_songs))
+    top_era_songs = era_songs.get(selected_month_year)
+    if top_era_songs is not None:
         st.markdown("Top 10 songs from that era:")
         for song, count in top_era_songs.items():
             st.markdown(f"- {song} ({count} plays)")
         
         # Export as CSV
-        csv = era_df.to_csv(index=False)
-        st.download_button("Download Era Data", csv, f"{selected_month_year}_playlist.csv")
+        era_csv = era_csv_bytes(df, selected_month_year)
+        st.download_button("Download Era Data", era_csv, f"{selected_month_year}_playlist.csv")
 
         # New fun feature: Imaginary "AI Remix" suggestion
         if st.button("Suggest AI Remix"):
@@ -258,11 +470,7 @@ with tab4:
 
     # Fun feature 4: Listening Streak
     st.subheader("Your Longest Listening Streak")
-    df['date'] = pd.to_datetime(df['date'])
-    daily_listens = df.groupby('date').size().reset_index(name='plays')
-    daily_listens = daily_listens.sort_values('date')
-    daily_listens['streak'] = (daily_listens['date'].diff() == pd.Timedelta(days=1)).cumsum()
-    max_streak = daily_listens.groupby('streak')['date'].count().max()
+    max_streak = longest_streak(df)
     st.info(f"Your longest consecutive listening streak: {max_streak} days! Keep it up! 🔥")
 
 # Footer
@@ -1,36 +1,96 @@
 # save as generate_csv.py and run: python generate_csv.py
-import json
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.feather as feather
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
 
-# Assume JSONs in ./original_jsons/
-json_files = [f for f in os.listdir('./original_jsons') if f.endswith('.json')]
-all_data = []
-
-for file in json_files:
-    with open(f'./original_jsons/{file}', 'r') as f:
-        data = json.load(f)
-        for entry in data:
-            entry['type'] = 'audio' if 'master_metadata_track_name' in entry else 'video'
-            if entry['type'] == 'video':
-                entry['master_metadata_track_name'] = entry.get('episode_name', 'Unknown')
-                entry['master_metadata_album_artist_name'] = entry.get('episode_show_name', 'Unknown')
-                entry['master_metadata_album_album_name'] = entry.get('episode_show_name', 'Unknown')
-        all_data.extend(data)
-
-df = pd.DataFrame(all_data)
-df['end_time'] = pd.to_datetime(df['ts'])
-df['start_time'] = df['end_time'] - pd.to_timedelta(df['ms_played'], unit='ms')
-df['date'] = df['end_time'].dt.date
-df['month_year'] = df['end_time'].dt.to_period('M')
-df['hours_played'] = df['ms_played'] / 3600000
-df['track'] = df['master_metadata_track_name'].fillna('Unknown Track')
-df['artist'] = df['master_metadata_album_artist_name'].fillna('Unknown Artist')
-df['album'] = df['master_metadata_album_album_name'].fillna('Unknown Album')
-df['skipped'] = df['skipped'].fillna(False)
-df['platform_clean'] = df['platform'].str.split(' ').str[0]
-df = df[df['ms_played'] > 0]
-
-df.to_csv('data/full_cleaned_spotify_history.csv', index=False)
-print(f"Generated CSV with {len(df)} rows.")
+# Prefer orjson when installed
+try:
+    import orjson as json
+except ImportError:
+    import json
+
+# Export fields this script or the app reads; other keys are skipped
+FIELDS = pa.struct([
+    ('ts', pa.string()),
+    ('platform', pa.string()),
+    ('ms_played', pa.int64()),
+    ('master_metadata_track_name', pa.string()),
+    ('master_metadata_album_artist_name', pa.string()),
+    ('master_metadata_album_album_name', pa.string()),
+    ('spotify_track_uri', pa.string()),
+    ('episode_name', pa.string()),
+    ('episode_show_name', pa.string()),
+    ('reason_start', pa.string()),
+    ('reason_end', pa.string()),
+    ('skipped', pa.bool_()),
+])
+
+
+def read_history(path):
+    """Parse one export file into an Arrow table; an empty file gives zero rows."""
+    with open(path, 'rb') as f:
+        data = json.loads(f.read())
+    return pa.Table.from_struct_array(pa.array(data, type=FIELDS))
+
+
+if __name__ == '__main__':
+    # Assume JSONs in ./original_jsons/
+    json_files = [f for f in os.listdir('./original_jsons') if f.endswith('.json')]
+    # Parse the files in parallel
+    workers = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(json_files)))) as pool:
+        tables = list(pool.map(read_history, [f'./original_jsons/{file}' for file in json_files]))
+
+    # Fields missing from a record come back as nulls
+    history = pa.concat_tables(tables)
+    # Drop zero-length plays
+    df = history.filter(pc.field('ms_played') > 0).to_pandas()
+    # Plays without a track name are episodes: take their names from the episode fields
+    is_audio = df['master_metadata_track_name'].notna()
+    df['type'] = np.where(is_audio, 'audio', 'video')
+    df['master_metadata_track_name'] = df['master_metadata_track_name'].where(is_audio, df['episode_name'])
+    df['master_metadata_album_artist_name'] = df['master_metadata_album_artist_name'].where(is_audio, df['episode_show_name'])
+    df['master_metadata_album_album_name'] = df['master_metadata_album_album_name'].where(is_audio, df['episode_show_name'])
+
+    # Parse timestamps ('2023-05-01T12:34:56Z')
+    df['end_time'] = pc.strptime(pa.array(df['ts']), format='%Y-%m-%dT%H:%M:%S%z', unit='s').to_pandas()
+    # Start = end - duration, floored to whole seconds as in the app
+    end_ns = df['end_time'].to_numpy(dtype='datetime64[ns]').view('i8')
+    start_ns = end_ns - df['ms_played'].to_numpy(dtype='i8') * 1_000_000
+    df['start_time'] = pd.to_datetime(start_ns // 1_000_000_000 * 1_000_000_000, utc=True)
+    # Day of the play
+    df['date'] = df['end_time'].to_numpy(dtype='datetime64[D]')
+    # 'YYYY-MM'
+    df['month_year'] = np.datetime_as_string(df['end_time'].to_numpy(dtype='datetime64[M]'), unit='M')
+    df['hours_played'] = df['ms_played'] / 3600000
+    # Display names, with placeholders for missing ones
+    df = df.join(
+        df[['master_metadata_track_name', 'master_metadata_album_artist_name', 'master_metadata_album_album_name']]
+        .set_axis(['track', 'artist', 'album'], axis=1)
+        .fillna({'track': 'Unknown Track', 'artist': 'Unknown Artist', 'album': 'Unknown Album'})
+    )
+    df['skipped'] = df['skipped'].fillna(False)
+    # First word of the platform
+    df['platform_clean'] = df['platform'].str.replace(r' .*', '', regex=True)
+    # Name columns as categories
+    df = df.astype({name: 'category' for name in ('track', 'artist', 'album', 'platform_clean')})
+
+    # Save the cleaned history: dates as days, play times in whole seconds
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for name, type_ in (('end_time', pa.timestamp('s', 'UTC')), ('start_time', pa.timestamp('s', 'UTC')), ('date', pa.date32())):
+        table = table.set_column(table.schema.get_field_index(name), name, table[name].cast(type_))
+    pv.write_csv(
+        table,
+        'data/full_cleaned_spotify_history.csv',
+        write_options=pv.WriteOptions(batch_size=64 * 1024),
+    )
+
+    # Same table as Feather for other tools
+    feather.write_feather(table, 'data/full_cleaned_spotify_history.feather', compression='zstd', compression_level=3)
+    print(f"Generated CSV with {len(df)} rows.")